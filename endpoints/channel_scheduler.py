@@ -0,0 +1,247 @@
+from typing import Any, Dict, Optional
+from collections import deque
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 所有 Channel 共用的同時處理上限，未設定（或 0）表示不限制
+MAX_CONCURRENT_INVOCATIONS = int(os.getenv("LINEBOT_MAX_CONCURRENCY") or 0) or None
+
+# 排隊超過此秒數的事件直接丟棄，避免 reply token 過期後才呼叫 Dify
+DEFAULT_MAX_WAIT_SECONDS = 30.0
+
+
+def channel_key(channel_secret: str) -> str:
+    """Return a short hash of the channel secret, safe to use in logs and metrics"""
+    return hashlib.sha256(channel_secret.encode('utf-8')).hexdigest()[:12]
+
+
+class ChannelOverloaded(Exception):
+    """
+    Raised when an event is dropped because its channel queue is full or it waited too long
+    """
+
+
+class _Ticket:
+    """
+    A request waiting in a channel queue, compared by identity
+    """
+
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class _ChannelQueue:
+    """
+    Per-channel queue state of the ChannelScheduler
+    """
+
+    def __init__(self):
+        self.waiting = deque()
+        self.running = 0
+        self.weight = 1.0
+        self.max_concurrency = 0
+        self.virtual_time = 0.0
+        self.served = 0
+        self.dropped = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+
+class ChannelScheduler:
+    """
+    Weighted fair scheduler sharing processing slots between channels
+
+    Every channel gets its own FIFO queue. When a slot frees up it goes to the
+    waiting channel with the lowest virtual time, which advances by 1/weight
+    per request, so a busy channel cannot starve the others. Without a global
+    limit and a per-channel cap requests are granted immediately and only
+    counted for the statistics.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        """
+        Initialize the ChannelScheduler
+
+        Args:
+            max_concurrency: Number of requests processed at once over all
+                channels, None for no limit
+        """
+        self.max_concurrency = max_concurrency if max_concurrency and max_concurrency > 0 else None
+        self.running = 0
+        self.virtual_time = 0.0
+        self.channels: Dict[str, _ChannelQueue] = {}
+        self.condition = threading.Condition()
+
+    @staticmethod
+    def _to_number(value, default, cast=float):
+        try:
+            number = cast(value)
+        except (TypeError, ValueError):
+            return default
+        return number if number > 0 else default
+
+    def slot(self, key: str, weight=None, max_concurrency=None,
+             max_queue=None, max_wait=None) -> "_ChannelSlot":
+        """
+        Return a context manager holding a processing slot for a channel
+
+        Args:
+            key: The channel key, see channel_key
+            weight: Relative share of the slots for this channel, default 1
+            max_concurrency: Maximum slots this channel may hold at once, default unlimited
+            max_queue: Maximum requests of this channel waiting for a slot, default unlimited
+            max_wait: Maximum seconds a request waits for a slot, default DEFAULT_MAX_WAIT_SECONDS
+
+        Returns:
+            A context manager that waits for the slot on enter and releases it on exit.
+            Entering raises ChannelOverloaded when the request is dropped.
+        """
+        return _ChannelSlot(
+            self, key,
+            weight=self._to_number(weight, 1.0),
+            max_concurrency=self._to_number(max_concurrency, 0, int),
+            max_queue=self._to_number(max_queue, 0, int),
+            max_wait=self._to_number(max_wait, DEFAULT_MAX_WAIT_SECONDS))
+
+    def acquire(self, key: str, weight: float = 1.0, max_concurrency: int = 0,
+                max_queue: int = 0, max_wait: float = DEFAULT_MAX_WAIT_SECONDS) -> float:
+        """
+        Wait until the channel is granted a slot
+
+        Returns:
+            The time the request waited in the queue, in seconds
+
+        Raises:
+            ChannelOverloaded: The queue of the channel is full or the wait exceeded max_wait
+        """
+        enqueued_at = time.monotonic()
+        ticket = _Ticket()
+        with self.condition:
+            channel = self.channels.get(key)
+            if channel is None:
+                channel = self.channels[key] = _ChannelQueue()
+            channel.weight = weight
+            channel.max_concurrency = max_concurrency
+            if not channel.waiting and not channel.running:
+                # 閒置的 Channel 不累積額度
+                channel.virtual_time = max(channel.virtual_time, self.virtual_time)
+            channel.waiting.append(ticket)
+            self._dispatch()
+            if not ticket.granted and max_queue and len(channel.waiting) > max_queue:
+                self._drop(key, channel, ticket, "queue full")
+            while not ticket.granted:
+                remaining = enqueued_at + max_wait - time.monotonic()
+                if remaining <= 0:
+                    self._drop(key, channel, ticket, "wait timeout")
+                self.condition.wait(remaining)
+            wait = time.monotonic() - enqueued_at
+            channel.total_wait += wait
+            channel.max_wait = max(channel.max_wait, wait)
+        return wait
+
+    def _drop(self, key: str, channel: _ChannelQueue, ticket: _Ticket, reason: str):
+        channel.waiting.remove(ticket)
+        channel.dropped += 1
+        logger.warning(
+            f"[ChannelScheduler] dropped event of channel={key}: {reason}, "
+            f"queued={len(channel.waiting)} running={channel.running} dropped={channel.dropped}")
+        raise ChannelOverloaded(f"channel {key}: {reason}")
+
+    def release(self, key: str, latency: float):
+        """
+        Release the slot held by the channel and record its processing latency
+
+        Args:
+            key: The channel key
+            latency: Time spent processing the request, in seconds
+        """
+        with self.condition:
+            channel = self.channels[key]
+            channel.running -= 1
+            channel.served += 1
+            channel.total_latency += latency
+            channel.max_latency = max(channel.max_latency, latency)
+            self.running -= 1
+            self._dispatch()
+            logger.debug(
+                f"[ChannelScheduler] channel={key} queued={len(channel.waiting)} "
+                f"running={channel.running} latency={latency * 1000:.1f}ms")
+
+    def _dispatch(self):
+        granted = False
+        while self.max_concurrency is None or self.running < self.max_concurrency:
+            candidates = [
+                channel for channel in self.channels.values()
+                if channel.waiting and (
+                    not channel.max_concurrency or channel.running < channel.max_concurrency)
+            ]
+            if not candidates:
+                break
+            channel = min(candidates, key=lambda c: c.virtual_time)
+            self.virtual_time = channel.virtual_time
+            channel.virtual_time += 1.0 / channel.weight
+            channel.running += 1
+            self.running += 1
+            channel.waiting.popleft().granted = True
+            granted = True
+        if granted:
+            self.condition.notify_all()
+
+    def stats(self, key: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Return queue depth, drops and latency per channel
+
+        Args:
+            key: Only return the statistics of this channel key
+
+        Returns:
+            A dictionary keyed by channel key, latencies in milliseconds
+        """
+        with self.condition:
+            return {
+                name: {
+                    "queued": len(channel.waiting),
+                    "running": channel.running,
+                    "served": channel.served,
+                    "dropped": channel.dropped,
+                    "avg_wait_ms": channel.total_wait / channel.served * 1000 if channel.served else 0.0,
+                    "max_wait_ms": channel.max_wait * 1000,
+                    "avg_latency_ms": channel.total_latency / channel.served * 1000 if channel.served else 0.0,
+                    "max_latency_ms": channel.max_latency * 1000,
+                }
+                for name, channel in self.channels.items()
+                if key is None or name == key
+            }
+
+
+class _ChannelSlot:
+    """
+    Context manager returned by ChannelScheduler.slot
+    """
+
+    def __init__(self, scheduler: ChannelScheduler, key: str, **limits):
+        self.scheduler = scheduler
+        self.key = key
+        self.limits = limits
+        self.started_at = 0.0
+
+    def __enter__(self):
+        self.scheduler.acquire(self.key, **self.limits)
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.scheduler.release(self.key, time.monotonic() - self.started_at)
+        return False
+
+
+channel_scheduler = ChannelScheduler(MAX_CONCURRENT_INVOCATIONS)
@@ -5,18 +5,35 @@ from dify_plugin.invocations.file import UploadFileResponse
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage, ImageMessage, ImageSendMessage, FlexSendMessage, BubbleContainer, BoxComponent, TextComponent
+from linebot.models import StickerMessage, LocationMessage, PostbackEvent, FollowEvent, QuickReply, QuickReplyButton, MessageAction
 import traceback
 import hmac
 import hashlib
 import base64
+import functools
+import json
 import logging
 import requests
 import os
+import random
 import re
+import time
 from markdown_it import MarkdownIt
+from endpoints.channel_scheduler import ChannelOverloaded, channel_key, channel_scheduler
 
 logger = logging.getLogger(__name__)
 
+# 每個 Channel 編譯後的本地回覆規則快取
+_reply_rules: Dict[str, "ReplyRules"] = {}
+
+# 每個 Channel 解析後的群組訊息過濾器快取
+_group_filters: Dict[str, "GroupMessageFilter"] = {}
+
+# 每個 Channel 的 bot user id 快取（bot user id, 失敗時間），避免每次 mention 檢查都呼叫 LINE API
+_bot_user_ids: Dict[str, tuple] = {}
+# 取得 bot user id 失敗後，間隔多久才重試（秒）
+BOT_INFO_RETRY_SECONDS = 60
+
 
 class LineEndpoint(Endpoint):
     def _invoke(self, request: Request, values: Mapping, settings: Mapping) -> Response:
@@ -54,9 +71,54 @@ class LineEndpoint(Endpoint):
         handler = WebhookHandler(lineChannelSecret)
         line_bot_api = LineBotApi(lineChannelAccessToken)
 
+        # 群組/聊天室訊息過濾器
+        group_filter = get_group_filter(lineChannelSecret, settings)
+        # 本地回覆規則，符合的事件直接回覆而不呼叫 Dify
+        reply_rules = get_reply_rules(lineChannelSecret, settings.get('reply_rules'))
+
+        def reply_locally(event, kind: str, key: Optional[str] = None) -> bool:
+            messages = reply_rules.match(kind, key)
+            if messages is None:
+                return False
+            try:
+                line_bot_api.reply_message(event.reply_token, messages)
+            except Exception as e:
+                logger.error(f"Error sending local {kind} reply: {e}")
+                logger.error(traceback.format_exc())
+            return True
+
+        def scheduled(func):
+            # 依 Channel 排隊，取得處理資源後才執行，避免單一 Channel 佔滿資源
+            @functools.wraps(func)
+            def wrapper(event):
+                try:
+                    with channel_scheduler.slot(
+                            channel_key(lineChannelSecret),
+                            weight=settings.get('channel_weight'),
+                            max_concurrency=settings.get('channel_max_concurrency'),
+                            max_queue=settings.get('channel_max_queue'),
+                            max_wait=settings.get('channel_max_wait')):
+                        return func(event)
+                except ChannelOverloaded as e:
+                    # 排隊過久或佇列已滿，放棄此事件以免 reply token 過期後仍呼叫 Dify
+                    logger.warning(f"Event dropped: {e}")
+            return wrapper
+
         # 註冊 TextMessage Event
         @handler.add(MessageEvent, message=TextMessage)
         def handle_message(event):
+            if reply_locally(event, "keyword", event.message.text):
+                return
+            # 群組/聊天室中未觸發的訊息直接忽略，不排隊、不讀取 storage 也不呼叫 Dify
+            in_group = getattr(event.source, "group_id", None) or getattr(event.source, "room_id", None)
+            if in_group and not group_filter.admit(
+                    event.message,
+                    lambda: get_bot_user_id(lineChannelSecret, line_bot_api)):
+                return
+            return answer_message(event)
+
+        @scheduled
+        def answer_message(event):
             # Line 傳來的 Message
             user_id = event.source.user_id
             group_id = getattr(event.source, "group_id", None)
@@ -180,6 +242,7 @@ class LineEndpoint(Endpoint):
                 )
 
         @handler.add(MessageEvent, message=ImageMessage)
+        @scheduled
         def handle_image(event):
             logger.debug(
                 f"[LineEndpoint] handle_image triggered. user_id={event.source.user_id}, message_id={event.message.id}")
@@ -279,6 +342,24 @@ class LineEndpoint(Endpoint):
                 response="ok",
                 content_type="text/plain",
             )
+
+        # 貼圖、位置、Postback 及加入好友事件只以本地回覆規則處理
+        @handler.add(MessageEvent, message=StickerMessage)
+        def handle_sticker(event):
+            reply_locally(event, "sticker", event.message.sticker_id)
+
+        @handler.add(MessageEvent, message=LocationMessage)
+        def handle_location(event):
+            reply_locally(event, "location")
+
+        @handler.add(PostbackEvent)
+        def handle_postback(event):
+            reply_locally(event, "postback", event.postback.data)
+
+        @handler.add(FollowEvent)
+        def handle_follow(event):
+            reply_locally(event, "follow")
+
         # 處理 webhook
         try:
             handler.handle(body, signature)
@@ -437,10 +518,142 @@ class MdFlexFormatHelper:
     Convert markdown text to a LINE Flex Message JSON structure
     """
 
-    def __init__(self):
+    BOLD_PATTERN = re.compile(r'\*\*(.*?)\*\*|__(.*?)__')
+
+    def __init__(self, compact: bool = True):
+        """
+        Initialize the MdFlexFormatHelper
+
+        Args:
+            compact: Omit properties that repeat LINE defaults (text align=start,
+                weight=regular, box spacing=none) and round column widths in
+                table components, the layout is unchanged
+        """
         self.md = MarkdownIt()
+        self.compact = compact
+        # 最近一次 md_to_flex 表格的 payload 大小（bytes），省略預設值前後
+        self.table_size_before = 0
+        self.table_size_after = 0
         logger.debug("MdFlexFormatHelper initialized")
 
+    # 與 LINE 預設值相同、可省略的屬性
+    LINE_DEFAULTS = {
+        "text": {"align": "start", "weight": "regular"},
+        "box": {"spacing": "none"},
+    }
+
+    @staticmethod
+    def _table_styles(column_count: int) -> Dict[str, dict]:
+        """Build the style templates shared by every row and cell of a table
+
+        Args:
+            column_count: Number of columns of the table
+
+        Returns:
+            A dictionary of component templates without their contents
+        """
+        border = {"borderColor": "#CCCCCC", "borderWidth": "1px"}
+        text = {"type": "text", "size": "xs", "align": "start"}
+        return {
+            "table": {"type": "box", "layout": "vertical", "margin": "md", "spacing": "none",
+                      **border, "cornerRadius": "md"},
+            "header_row": {"type": "box", "layout": "horizontal", "backgroundColor": "#EEEEEE",
+                           "paddingAll": "sm", **border},
+            "data_row": {"type": "box", "layout": "horizontal", "paddingAll": "xs", **border},
+            "cell": {"type": "box", "layout": "vertical", "paddingAll": "sm",
+                     "width": f"{100/column_count}%", **border},
+            "header_text": {**text, "weight": "bold", "wrap": True},
+            "text": {**text, "wrap": True, "weight": "regular"},
+            "bold_text": {**text, "wrap": True, "weight": "bold"},
+            "empty_text": {**text, "text": " "},
+        }
+
+    @classmethod
+    def _strip_defaults(cls, component: dict) -> dict:
+        """Remove properties equal to LINE defaults and round widths, in place
+
+        Args:
+            component: A Flex component and its nested contents
+
+        Returns:
+            The same component
+        """
+        for name, value in cls.LINE_DEFAULTS.get(component.get("type"), {}).items():
+            if component.get(name) == value:
+                del component[name]
+        width = component.get("width")
+        if isinstance(width, str) and width.endswith("%"):
+            # 無條件捨去到小數兩位，欄寬總和不超過 100%
+            component["width"] = f"{int(float(width[:-1]) * 100) / 100:g}%"
+        for child in component.get("contents", []):
+            cls._strip_defaults(child)
+        return component
+
+    def _table_component(self, table: list) -> dict:
+        """Convert the markdown lines of one table to a Flex box component
+
+        Args:
+            table: Markdown lines of the table, header first
+
+        Returns:
+            A dictionary representing a LINE Flex box component
+        """
+        # Process header row
+        header_cells = [cell.strip()
+                        for cell in table[0].split('|') if cell.strip()]
+
+        # Check if second row is separator (---|---)
+        is_separator = all(
+            '-' in cell for cell in table[1].split('|') if cell.strip())
+        start_idx = 2 if is_separator else 1
+
+        styles = self._table_styles(len(header_cells))
+        cell_style = styles["cell"]
+
+        def cell_box(text_component: dict) -> dict:
+            return {**cell_style, "contents": [text_component]}
+
+        # Create table component with border
+        table_component = {**styles["table"], "contents": []}
+
+        # Add header row
+        table_component["contents"].append({
+            **styles["header_row"],
+            "contents": [cell_box({**styles["header_text"], "text": cell})
+                         for cell in header_cells],
+        })
+
+        # Add data rows
+        for row_idx in range(start_idx, len(table)):
+            cells = [cell.strip()
+                     for cell in table[row_idx].split('|') if cell.strip()]
+
+            if not cells:
+                continue
+
+            # Create cells with same width as headers for alignment
+            row_contents = []
+            for cell in cells[:len(header_cells)]:
+                # Handle bold text with ** or __
+                cell_text, bold_count = self.BOLD_PATTERN.subn(
+                    lambda m: m.group(1) if m.group(1) else (m.group(2) or ""), cell)
+                if bold_count:
+                    row_contents.append(cell_box({**styles["bold_text"], "text": cell_text}))
+                else:
+                    row_contents.append(cell_box({**styles["text"], "text": cell_text}))
+
+            # Add empty cells if needed to match header count
+            while len(row_contents) < len(header_cells):
+                row_contents.append(cell_box(styles["empty_text"]))
+
+            table_component["contents"].append({
+                **styles["data_row"],
+                "backgroundColor": "#FFFFFF" if row_idx % 2 == 0 else "#F8F8F8",
+                "contents": row_contents,
+            })
+
+        return table_component
+
     def md_to_flex(self, md_text: str) -> dict:
         """Convert markdown text to a LINE Flex Message JSON structure
 
@@ -455,6 +668,7 @@ class MdFlexFormatHelper:
         # Process tables first with a custom approach
         has_table = '|' in md_text and re.search(r'\|.*\|.*\|', md_text)
         table_contents = []
+        self.table_size_before = self.table_size_after = 0
 
         if has_table:
             logger.debug("Table detected, processing table format")
@@ -483,139 +697,18 @@ class MdFlexFormatHelper:
             for table in table_rows:
                 if len(table) < 2:  # Need at least header and separator
                     continue
+                table_contents.append(self._table_component(table))
 
-                # Process header row
-                header_cells = [cell.strip()
-                                for cell in table[0].split('|') if cell.strip()]
-
-                # Check if second row is separator (---|---)
-                is_separator = all(
-                    '-' in cell for cell in table[1].split('|') if cell.strip())
-                start_idx = 2 if is_separator else 1
-
-                # Create table component with border
-                table_component = {
-                    "type": "box",
-                    "layout": "vertical",
-                    "margin": "md",
-                    "spacing": "none",  # Remove spacing between rows for grid effect
-                    "borderColor": "#CCCCCC",
-                    "borderWidth": "1px",
-                    "cornerRadius": "md",
-                    "contents": []
-                }
-
-                # Add header row
-                header_row = {
-                    "type": "box",
-                    "layout": "horizontal",
-                    "contents": [],
-                    "backgroundColor": "#EEEEEE",
-                    "paddingAll": "sm",  # Smaller padding
-                    "borderColor": "#CCCCCC",
-                    "borderWidth": "1px"
-                }
-
-                # Create header cells
-                for cell in header_cells:
-                    header_row["contents"].append({
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [{
-                            "type": "text",
-                            "text": cell,
-                            "weight": "bold",
-                            "size": "xs",  # Smaller text
-                            "align": "start",  # Left align
-                            "wrap": True
-                        }],
-                        "paddingAll": "sm",
-                        "width": f"{100/len(header_cells)}%",
-                        "borderColor": "#CCCCCC",
-                        "borderWidth": "1px"
-                    })
-
-                table_component["contents"].append(header_row)
-
-                # Add data rows
-                for row_idx in range(start_idx, len(table)):
-                    row = table[row_idx]
-                    cells = [cell.strip()
-                             for cell in row.split('|') if cell.strip()]
-
-                    if not cells:
-                        continue
-
-                    data_row = {
-                        "type": "box",
-                        "layout": "horizontal",
-                        "contents": [],
-                        "paddingAll": "xs",  # Smaller padding
-                        "backgroundColor": "#FFFFFF" if row_idx % 2 == 0 else "#F8F8F8",
-                        "borderColor": "#CCCCCC",
-                        "borderWidth": "1px"
-                    }
-
-                    # Create cells with same width as headers for alignment
-                    for idx, cell in enumerate(cells):
-                        if idx >= len(header_cells):
-                            break  # Skip extra cells
-
-                        # Process cell content for bold and other formatting
-                        cell_text = cell
-                        weight = "regular"
-
-                        # Handle bold text with ** or __
-                        if re.search(r'\*\*(.*?)\*\*', cell) or re.search(r'__(.*?)__', cell):
-                            # Extract bold text
-                            bold_matches = re.findall(
-                                r'\*\*(.*?)\*\*|__(.*?)__', cell)
-                            for match in bold_matches:
-                                bold_text = match[0] if match[0] else match[1]
-                                cell_text = cell_text.replace(
-                                    f"**{bold_text}**", bold_text)
-                                cell_text = cell_text.replace(
-                                    f"__{bold_text}__", bold_text)
-                            weight = "bold"
-
-                        # Create cell with border
-                        data_row["contents"].append({
-                            "type": "box",
-                            "layout": "vertical",
-                            "contents": [{
-                                "type": "text",
-                                "text": cell_text,
-                                "size": "xs",  # Smaller text
-                                "align": "start",  # Left align
-                                "wrap": True,
-                                "weight": weight
-                            }],
-                            "paddingAll": "sm",
-                            "width": f"{100/len(header_cells)}%",
-                            "borderColor": "#CCCCCC",
-                            "borderWidth": "1px"
-                        })
-
-                    # Add empty cells if needed to match header count
-                    while len(data_row["contents"]) < len(header_cells):
-                        data_row["contents"].append({
-                            "type": "box",
-                            "layout": "vertical",
-                            "contents": [{
-                                "type": "text",
-                                "text": " ",
-                                "size": "xs",
-                                "align": "start"
-                            }],
-                            "paddingAll": "sm",
-                            "width": f"{100/len(header_cells)}%",
-                            "borderColor": "#CCCCCC",
-                            "borderWidth": "1px"
-                        })
-
-                    table_component["contents"].append(data_row)
-
-                table_contents.append(table_component)
+            self.table_size_before = flex_payload_size(table_contents)
+            if self.compact:
+                for component in table_contents:
+                    self._strip_defaults(component)
+                self.table_size_after = flex_payload_size(table_contents)
+            else:
+                self.table_size_after = self.table_size_before
+            logger.debug(
+                f"Table payload size: {self.table_size_before} bytes before, "
+                f"{self.table_size_after} bytes after compaction")
 
         # Process the rest of the markdown
         non_table_content = md_text
@@ -763,3 +856,261 @@ class MdFlexFormatHelper:
 
         logger.debug(f"Created bubble with {len(body_contents)} components")
         return bubble
+
+
+def flex_payload_size(contents) -> int:
+    """Return the size in bytes of Flex contents serialized the way LineBotApi sends them (json.dumps defaults)"""
+    return len(json.dumps(contents).encode('utf-8'))
+
+
+class ReplyRules:
+    """
+    Lookup index of the local reply rules of a channel
+
+    The rules are a JSON list in the reply_rules setting, for example:
+
+        [
+            {"type": "keyword", "match": "hours", "reply": "We are open 9:00-18:00"},
+            {"type": "postback", "match": "action=menu", "reply": {"type": "bubble", ...}},
+            {"type": "sticker", "reply": "Nice sticker!", "quick_reply": ["Menu", "Hours"]},
+            {"type": "follow", "reply": "Thanks for adding me!"}
+        ]
+
+    type is one of keyword, postback, sticker, location and follow. match is
+    the message text (compared case-insensitively), postback data or sticker
+    id; it is required for keyword rules, postback and sticker rules without
+    it match every event of their type, and location and follow rules take
+    none. reply is a text or a Flex container. An invalid rule is logged and
+    skipped, the other rules still apply.
+    """
+
+    KINDS = ("keyword", "postback", "sticker", "location", "follow")
+    # 事件沒有可比對的值，只能用萬用規則
+    KINDS_WITHOUT_MATCH = ("location", "follow")
+    # LINE 快速回覆的限制
+    MAX_QUICK_REPLY_ITEMS = 13
+    MAX_QUICK_REPLY_LABEL = 20
+
+    def __init__(self, raw_rules: Optional[str] = None):
+        """
+        Compile the rules into the lookup index
+
+        Args:
+            raw_rules: The reply_rules setting, a JSON list of rules
+        """
+        self.raw_rules = raw_rules
+        self.index: Dict[tuple, list] = {}
+        if not raw_rules:
+            return
+        try:
+            rules = json.loads(raw_rules)
+            if not isinstance(rules, list):
+                raise ValueError("reply_rules must be a JSON list")
+        except ValueError as e:
+            logger.error(f"Invalid reply_rules, local replies disabled: {e}")
+            return
+        for rule in rules:
+            # 無效的規則只略過該條，不影響其他規則
+            try:
+                kind, key, messages = self._compile(rule)
+            except Exception as e:
+                logger.error(f"Invalid reply rule skipped: {e}")
+                continue
+            # 先定義的規則優先
+            self.index.setdefault((kind, key), messages)
+
+    @classmethod
+    def _compile(cls, rule) -> tuple:
+        if not isinstance(rule, dict):
+            raise ValueError(f"reply rule is not a JSON object: {rule}")
+        kind = rule.get("type")
+        if kind not in cls.KINDS:
+            raise ValueError(f"unknown reply rule type: {kind}")
+        if kind == "keyword" and not str(rule.get("match") or "").strip():
+            raise ValueError(f"keyword reply rule without match: {rule}")
+        if kind in cls.KINDS_WITHOUT_MATCH and rule.get("match") is not None:
+            raise ValueError(f"{kind} reply rule cannot have match: {rule}")
+        return kind, cls._normalize(kind, rule.get("match")), cls._build_messages(rule)
+
+    @staticmethod
+    def _normalize(kind: str, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        key = str(key).strip()
+        return key.lower() if kind == "keyword" else key
+
+    @classmethod
+    def _build_messages(cls, rule: dict) -> list:
+        reply = rule.get("reply")
+        if isinstance(reply, dict):
+            message = FlexSendMessage(
+                alt_text=rule.get("alt_text", "FlexMessage"), contents=reply)
+            if message.contents is None:
+                raise ValueError(f"reply is not a Flex container: {reply}")
+        elif reply:
+            message = TextSendMessage(text=str(reply))
+        else:
+            raise ValueError(f"reply rule without reply: {rule}")
+        quick_reply = rule.get("quick_reply")
+        if quick_reply:
+            if len(quick_reply) > cls.MAX_QUICK_REPLY_ITEMS:
+                raise ValueError(
+                    f"more than {cls.MAX_QUICK_REPLY_ITEMS} quick reply items: {quick_reply}")
+            message.quick_reply = QuickReply(items=[cls._quick_reply_item(item) for item in quick_reply])
+        return [message]
+
+    @classmethod
+    def _quick_reply_item(cls, item) -> QuickReplyButton:
+        # 標籤超過 LINE 上限時截斷，送出的文字保持完整
+        if isinstance(item, str):
+            return QuickReplyButton(action=MessageAction(
+                label=item[:cls.MAX_QUICK_REPLY_LABEL], text=item))
+        if not isinstance(item, dict) or not isinstance(item.get("action"), dict):
+            raise ValueError(f"quick reply item is neither a text nor a quick reply button: {item}")
+        action = dict(item["action"])
+        if isinstance(action.get("label"), str):
+            action["label"] = action["label"][:cls.MAX_QUICK_REPLY_LABEL]
+        button = QuickReplyButton.new_from_json_dict({**item, "action": action})
+        if button.action is None:
+            raise ValueError(f"quick reply item has an unknown action type: {item}")
+        return button
+
+    def match(self, kind: str, key: Optional[str] = None) -> Optional[list]:
+        """
+        Look up the reply of an event
+
+        Args:
+            kind: The rule type of the event
+            key: The message text, postback data or sticker id of the event
+
+        Returns:
+            The messages to reply with, or None if no rule matches
+        """
+        if not self.index:
+            return None
+        messages = self.index.get((kind, self._normalize(kind, key)))
+        if messages is None and key is not None:
+            messages = self.index.get((kind, None))
+        return messages
+
+
+def get_reply_rules(channel_secret: str, raw_rules: Optional[str]) -> ReplyRules:
+    """Return the compiled reply rules of a channel, compiling them only when the setting changed"""
+    key = channel_key(channel_secret)
+    reply_rules = _reply_rules.get(key)
+    if reply_rules is None or reply_rules.raw_rules != raw_rules:
+        reply_rules = _reply_rules[key] = ReplyRules(raw_rules)
+    return reply_rules
+
+
+def get_bot_user_id(channel_secret: str, line_bot_api: LineBotApi) -> Optional[str]:
+    """Return the bot's own user id, fetched once per channel and cached in process
+
+    A failed lookup is cached for BOT_INFO_RETRY_SECONDS, so mentions are not
+    checked against LINE on every message while the API is unavailable.
+
+    Args:
+        channel_secret: The channel secret of the channel
+        line_bot_api: The LINE Bot API client of the channel
+
+    Returns:
+        The bot user id or None if it cannot be retrieved
+    """
+    key = channel_key(channel_secret)
+    bot_user_id, failed_at = _bot_user_ids.get(key, (None, None))
+    if bot_user_id is not None:
+        return bot_user_id
+    if failed_at is not None and time.monotonic() - failed_at < BOT_INFO_RETRY_SECONDS:
+        return None
+    try:
+        bot_user_id = line_bot_api.get_bot_info().user_id
+        _bot_user_ids[key] = (bot_user_id, None)
+    except Exception as e:
+        logger.error(f"Error fetching bot info: {e}")
+        _bot_user_ids[key] = (None, time.monotonic())
+    return bot_user_id
+
+
+class GroupMessageFilter:
+    """
+    Decide whether a text message in a group or room should be sent to Dify
+    """
+
+    SETTINGS = ("group_trigger_mention", "group_trigger_prefixes",
+                "group_trigger_keywords", "group_sample_rate")
+
+    def __init__(self, settings: Mapping):
+        """
+        Initialize the filter from the endpoint settings
+
+        Args:
+            settings: The endpoint settings. A message is admitted when any of
+                the configured triggers matches; with no trigger configured
+                every message is admitted.
+        """
+        self.raw_settings = self.settings_of(settings)
+        self.require_mention = bool(settings.get("group_trigger_mention"))
+        self.prefixes = tuple(self._split(settings.get("group_trigger_prefixes")))
+        self.keywords = tuple(self._split(settings.get("group_trigger_keywords")))
+        try:
+            self.sample_rate = min(max(float(settings.get("group_sample_rate") or 0), 0.0), 1.0)
+        except (TypeError, ValueError):
+            logger.error(
+                f"Invalid group_sample_rate: {settings.get('group_sample_rate')}")
+            self.sample_rate = 0.0
+        self.enabled = bool(self.require_mention or self.prefixes
+                            or self.keywords or self.sample_rate)
+
+    @classmethod
+    def settings_of(cls, settings: Mapping) -> tuple:
+        """Return the raw values of the settings the filter is built from"""
+        return tuple(settings.get(name) for name in cls.SETTINGS)
+
+    @staticmethod
+    def _split(value: Optional[str]) -> list:
+        if not value:
+            return []
+        return [item.strip().lower() for item in value.split(",") if item.strip()]
+
+    def admit(self, message: TextMessage, get_bot_user_id=None) -> bool:
+        """
+        Check a text message against the configured triggers
+
+        Args:
+            message: The LINE text message
+            get_bot_user_id: Callable returning the bot user id, only called
+                when the message mentions someone
+
+        Returns:
+            True if the message should be answered
+        """
+        if not self.enabled:
+            return True
+
+        text = message.text.lower()
+        # 清除對話歷史的命令不受過濾
+        if text == '/clearconversationhistory':
+            return True
+        if self.prefixes and text.startswith(self.prefixes):
+            return True
+        if self.keywords and any(keyword in text for keyword in self.keywords):
+            return True
+        if self.require_mention:
+            mention = getattr(message, "mention", None)
+            mentionees = getattr(mention, "mentionees", None) or []
+            if mentionees and get_bot_user_id is not None:
+                bot_user_id = get_bot_user_id()
+                if bot_user_id and any(m.user_id == bot_user_id for m in mentionees):
+                    return True
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        return False
+
+
+def get_group_filter(channel_secret: str, settings: Mapping) -> GroupMessageFilter:
+    """Return the group message filter of a channel, parsing the settings only when they changed"""
+    key = channel_key(channel_secret)
+    group_filter = _group_filters.get(key)
+    if group_filter is None or group_filter.raw_settings != GroupMessageFilter.settings_of(settings):
+        group_filter = _group_filters[key] = GroupMessageFilter(settings)
+    return group_filter
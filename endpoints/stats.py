@@ -0,0 +1,24 @@
+from typing import Mapping
+from werkzeug import Request, Response
+from dify_plugin import Endpoint
+import json
+
+from endpoints.channel_scheduler import channel_key, channel_scheduler
+
+
+class LineStatsEndpoint(Endpoint):
+    def _invoke(self, request: Request, values: Mapping, settings: Mapping) -> Response:
+        """
+        回傳此 Channel 的排隊深度、丟棄數及延遲統計。
+        """
+        lineChannelSecret = settings.get('channel_secret')
+        if not lineChannelSecret:
+            return Response(status=404, response="not found")
+
+        key = channel_key(lineChannelSecret)
+        stats = channel_scheduler.stats(key).get(key, {})
+        return Response(
+            status=200,
+            response=json.dumps({"channel": key, **stats}),
+            content_type="application/json",
+        )
@@ -0,0 +1,532 @@
+"""
+Replay signed LINE webhook traffic into LineEndpoint against local fakes of
+the LINE Messaging API and Dify, and report throughput, tail latency, memory
+use and error rate.
+
+Run from the repository root:
+
+    python -m loadtest.harness --rps 50 --duration 30 --channels 4
+    python -m loadtest.harness --recorded webhooks.jsonl --rps 20
+
+A recorded file holds one webhook body (the JSON LINE posted) per line; the
+bodies get fresh reply tokens and are re-signed with the harness channel
+secrets before replay.
+
+Errors are counted per event from outcomes, since LineEndpoint answers 200
+even when a handler fails. The fakes record which event every call belongs
+to (reply token, message id, or the webhook request for the in-process Dify
+app): an event fails when any call made for it failed, or when a call was
+made for it and no reply arrived. Events no fake was called for (e.g.
+rejected by the group filter) are ignored. The report lists how many events
+had an injected failure next to the failed count, which must not be lower.
+"""
+# endpoints.linebot imports dify_plugin, which monkey patches the standard
+# library with gevent, so it must be imported before anything else.
+from endpoints import linebot as linebot_endpoint
+
+import argparse
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import random
+import re
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from linebot import LineBotApi
+from werkzeug.test import EnvironBuilder
+
+# 1x1 JPEG returned as message content
+FAKE_IMAGE = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQEASABIAAD/2wBDAP//////////////////////////////////////"
+    "////////////////////////////////////////////////wgALCAABAAEBAREA/8QAFBAB"
+    "AAAAAAAAAAAAAAAAAAAAAP/aAAgBAQABPxA=")
+
+
+class FakeService:
+    """
+    Latency and failure injection shared by the fake services
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0):
+        """
+        Initialize the FakeService
+
+        Args:
+            latency: Mean delay added to every call, in seconds
+            jitter: Maximum random deviation from the mean delay, in seconds
+            failure_rate: Fraction (0-1) of calls that fail
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls: Dict[str, int] = {}
+        self.failures = 0
+        # 事件 key（reply token 或 message id）→ 該事件是否有呼叫失敗
+        self.events: Dict[str, bool] = {}
+        self.lock = threading.Lock()
+        # 每個 webhook 請求在自己的執行緒中處理，以此計算該請求的呼叫與失敗次數
+        self.local = threading.local()
+
+    def reset_local(self):
+        """Reset the call counters of the current thread before a webhook request"""
+        self.local.calls = 0
+        self.local.failures = 0
+
+    def _call(self, name: str, event_key: Optional[str] = None) -> bool:
+        """
+        Count the call, wait the configured latency and return False if it should fail
+
+        Args:
+            name: The name of the called operation
+            event_key: Reply token or message id of the event the call was made for
+        """
+        self.local.calls = getattr(self.local, "calls", 0) + 1
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        ok = random.random() >= self.failure_rate
+        if not ok:
+            self.local.failures = getattr(self.local, "failures", 0) + 1
+        with self.lock:
+            if not ok:
+                self.failures += 1
+            if event_key is not None:
+                self.events[event_key] = self.events.get(event_key, False) or not ok
+        return ok
+
+    def event_outcome(self, keys) -> Optional[bool]:
+        """Return True if a call for any of the event keys failed, False if all succeeded, None if none was made"""
+        with self.lock:
+            outcomes = [self.events[key] for key in keys if key in self.events]
+        return any(outcomes) if outcomes else None
+
+
+class FakeHttpService(FakeService):
+    """
+    FakeService served over HTTP on a local port
+    """
+
+    routes: List[Tuple[str, str, str]] = []
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                for route_method, pattern, name in service.routes:
+                    match = re.fullmatch(pattern, self.path.split("?")[0])
+                    if route_method == method and match:
+                        if not service._call(name, service.event_key(name, body, *match.groups())):
+                            return self._send(500, {"message": "fake failure"})
+                        return self._send(*getattr(service, name)(body, *match.groups()))
+                self._send(404, {"message": "not found"})
+
+            def _send(self, status, payload, content_type="application/json"):
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def event_key(self, name: str, body: bytes, *groups) -> Optional[str]:
+        """Return the reply token or message id a call was made for, the HTTP server runs in its own threads"""
+        return None
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeLineApi(FakeHttpService):
+    """
+    Fake LINE Messaging API: reply, push, message content and bot info
+    """
+
+    routes = [
+        ("POST", r"/v2/bot/message/reply", "reply"),
+        ("POST", r"/v2/bot/message/push", "push"),
+        ("GET", r"/v2/bot/message/([^/]+)/content", "content"),
+        ("GET", r"/v2/bot/info", "info"),
+    ]
+
+    BOT_USER_ID = "Ufakebot0000000000000000000000000"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.replied = set()
+
+    @staticmethod
+    def _reply_token(body: bytes) -> Optional[str]:
+        try:
+            return json.loads(body).get("replyToken")
+        except ValueError:
+            return None
+
+    def event_key(self, name, body, *groups):
+        if name == "reply":
+            return self._reply_token(body)
+        if name == "content":
+            return groups[0]
+        return None
+
+    def reply(self, body):
+        with self.lock:
+            self.replied.add(self._reply_token(body))
+        return 200, {"sentMessages": []}
+
+    def push(self, body):
+        return 200, {"sentMessages": []}
+
+    def content(self, body, message_id):
+        return 200, FAKE_IMAGE, "image/jpeg"
+
+    def info(self, body):
+        return 200, {"userId": self.BOT_USER_ID, "basicId": "@fakebot",
+                     "displayName": "Fake Bot", "chatMode": "bot", "markAsReadMode": "auto"}
+
+
+class FakeDifyApi(FakeHttpService):
+    """
+    Fake Dify service API file upload used by FileUploader.upload_file_via_api
+    """
+
+    routes = [("POST", r"/v1/files/upload", "upload")]
+
+    def event_key(self, name, body, *groups):
+        # LineEndpoint 以 "<message id>.jpg" 作為上傳的檔名
+        match = re.search(rb'filename="([^"/]+)\.\w+"', body)
+        return match.group(1).decode("utf-8") if match else None
+
+    def upload(self, body):
+        return 201, {"id": str(uuid.uuid4()), "name": "image.jpg", "size": len(body),
+                     "extension": "jpg", "mime_type": "image/jpeg"}
+
+
+class FakeDifyApp(FakeService):
+    """
+    Fake of session.app.chat, answering every query with a fixed text
+    """
+
+    def __init__(self, answer: str = "OK", **kwargs):
+        super().__init__(**kwargs)
+        self.answer = answer
+        self.chat = self
+
+    def invoke(self, app_id: str, query: str, inputs: dict, response_mode: str,
+               conversation_id: Optional[str] = None, **kwargs) -> dict:
+        if not self._call("chat"):
+            raise RuntimeError("fake Dify app failure")
+        return {"answer": self.answer, "conversation_id": conversation_id or str(uuid.uuid4())}
+
+
+class FakeStorage:
+    """
+    In-memory fake of session.storage
+    """
+
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key: str, val: bytes):
+        with self.lock:
+            self.data[key] = val
+
+    def delete(self, key: str):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+class FakeSession:
+    """
+    The parts of the Dify plugin session used by LineEndpoint
+    """
+
+    def __init__(self, app: FakeDifyApp):
+        self.app = app
+        self.storage = FakeStorage()
+
+
+def sign(channel_secret: str, body: str) -> str:
+    """Return the X-Line-Signature of a webhook body"""
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def synthetic_body(index: int, users: int, group_ratio: float, image_ratio: float, text: str) -> dict:
+    """Build a webhook body holding one text or image message event"""
+    if random.random() < group_ratio:
+        source = {"type": "group", "groupId": f"Cgroup{index % max(users // 10, 1)}",
+                  "userId": f"Uuser{index % users}"}
+    else:
+        source = {"type": "user", "userId": f"Uuser{index % users}"}
+    if random.random() < image_ratio:
+        message = {"id": str(100000 + index), "type": "image",
+                   "contentProvider": {"type": "line"}, "quoteToken": uuid.uuid4().hex}
+    else:
+        message = {"id": str(100000 + index), "type": "text", "text": text,
+                   "quoteToken": uuid.uuid4().hex}
+    event = {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": source,
+        "webhookEventId": uuid.uuid4().hex,
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": message,
+    }
+    return {"destination": "Ufakebot", "events": [event]}
+
+
+def load_recorded(path: str) -> List[dict]:
+    """Load recorded webhook bodies, one JSON document per line"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def with_fresh_reply_tokens(body: dict) -> dict:
+    """Copy a recorded webhook body, giving every event a new reply token"""
+    events = []
+    for event in body.get("events", []):
+        event = dict(event)
+        if "replyToken" in event:
+            event["replyToken"] = uuid.uuid4().hex
+        events.append(event)
+    return {**body, "events": events}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def parse_settings(items: List[str]) -> Dict[str, Any]:
+    """Parse repeated --setting key=value options, values given as JSON when possible"""
+    settings = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        try:
+            settings[key] = json.loads(value)
+        except ValueError:
+            settings[key] = value
+    return settings
+
+
+def run(args) -> Dict[str, Any]:
+    """
+    Replay the webhook traffic and collect the results
+
+    Args:
+        args: The parsed command line arguments
+
+    Returns:
+        A dictionary with the load test report
+    """
+    random.seed(args.seed)
+    line_api = FakeLineApi(latency=args.line_latency, jitter=args.line_jitter,
+                           failure_rate=args.line_failure_rate)
+    dify_api = FakeDifyApi(latency=args.upload_latency, failure_rate=args.upload_failure_rate)
+    dify_app = FakeDifyApp(answer=args.answer, latency=args.dify_latency,
+                           jitter=args.dify_jitter, failure_rate=args.dify_failure_rate)
+    linebot_endpoint.LineBotApi = functools.partial(
+        LineBotApi, endpoint=line_api.url, data_endpoint=line_api.url)
+    endpoint = linebot_endpoint.LineEndpoint(FakeSession(dify_app))
+
+    extra_settings = parse_settings(args.setting)
+    channels = []
+    for n in range(args.channels):
+        settings = {
+            "channel_secret": f"loadtest-secret-{n}",
+            "channel_access_token": f"loadtest-token-{n}",
+            "app": {"app_id": "loadtest"},
+            "dify_api_key": "loadtest",
+            "dify_api_url": f"{dify_api.url}/v1",
+            "img_variable_name": "img",
+            "img_prompt": "Describe the image uploaded in files",
+        }
+        settings.update(extra_settings)
+        channels.append(settings)
+
+    recorded = load_recorded(args.recorded) if args.recorded else None
+    total = int(args.rps * args.duration)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    outcomes = {"events": 0, "answered": 0, "failed": 0, "ignored": 0, "with_injected_failure": 0}
+    lock = threading.Lock()
+
+    def fire(index: int, scheduled_at: float):
+        # 熱門 Channel 佔 skew 比例的流量，其餘平均分配
+        if args.skew and random.random() < args.skew:
+            settings = channels[0]
+        else:
+            settings = channels[index % len(channels)]
+        if recorded:
+            payload = with_fresh_reply_tokens(recorded[index % len(recorded)])
+        else:
+            payload = synthetic_body(index, args.users, args.group_ratio, args.image_ratio, args.text)
+        body = json.dumps(payload)
+        event_keys = [
+            [key for key in (event.get("replyToken"), event.get("message", {}).get("id")) if key]
+            for event in payload.get("events", [])
+        ]
+        dify_app.reset_local()
+        request = EnvironBuilder(
+            method="POST", path="/", data=body.encode("utf-8"),
+            headers={"X-Line-Signature": sign(settings["channel_secret"], body),
+                     "Content-Type": "application/json"},
+        ).get_request()
+        try:
+            status = endpoint.invoke(request, {}, settings).status_code
+        except Exception:
+            status = 0
+        # 從排定時間開始計算延遲，排隊時間也計入
+        latency = time.monotonic() - scheduled_at
+        events = len(event_keys)
+        answered = failed = pending = injected = 0
+        for keys in event_keys:
+            outcomes_of_event = [line_api.event_outcome(keys), dify_api.event_outcome(keys)]
+            with line_api.lock:
+                replied = any(key in line_api.replied for key in keys)
+            if any(outcomes_of_event):
+                # 取得內容、上傳或回覆任一呼叫失敗
+                failed += 1
+                injected += 1
+            elif replied:
+                answered += 1
+            elif False in outcomes_of_event:
+                # 已呼叫 LINE 或 Dify 卻沒有回覆
+                failed += 1
+            else:
+                pending += 1
+        # Dify App 在請求執行緒中呼叫，只能按請求計算：呼叫了卻沒有回覆的事件算失敗
+        failed += min(pending, max(dify_app.local.failures, dify_app.local.calls - answered - failed))
+        injected += min(pending, dify_app.local.failures)
+        if status != 200:
+            # 整個 webhook 失敗，所有事件都算失敗
+            failed = events - answered
+        with lock:
+            latencies.append(latency)
+            statuses[status] = statuses.get(status, 0) + 1
+            outcomes["events"] += events
+            outcomes["answered"] += answered
+            outcomes["failed"] += failed
+            outcomes["ignored"] += events - answered - failed
+            outcomes["with_injected_failure"] += injected
+
+    if args.trace_memory:
+        tracemalloc.start()
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for index in range(total):
+            scheduled_at = started_at + index / args.rps
+            delay = scheduled_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(fire, index, scheduled_at)
+    elapsed = time.monotonic() - started_at
+
+    report = {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "target_rps": args.rps,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "events": outcomes,
+        # 需要回覆的事件中失敗的比例
+        "error_rate": round(outcomes["failed"] / (outcomes["answered"] + outcomes["failed"]), 4)
+        if outcomes["answered"] + outcomes["failed"] else 0.0,
+        "statuses": statuses,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p90": round(percentile(latencies, 90) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies, default=0.0) * 1000, 1),
+        },
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "line_api": {"calls": line_api.calls, "injected_failures": line_api.failures},
+        "dify_upload_api": {"calls": dify_api.calls, "injected_failures": dify_api.failures},
+        "dify_app": {"calls": dify_app.calls, "injected_failures": dify_app.failures},
+        "channels": linebot_endpoint.channel_scheduler.stats(),
+    }
+    if args.trace_memory:
+        report["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    line_api.close()
+    dify_api.close()
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load test LineEndpoint against local fakes of LINE and Dify")
+    parser.add_argument("--rps", type=float, default=20, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic to send")
+    parser.add_argument("--workers", type=int, default=200, help="concurrent webhook requests")
+    parser.add_argument("--channels", type=int, default=1, help="number of LINE channels")
+    parser.add_argument("--skew", type=float, default=0.0,
+                        help="fraction of traffic sent to the first channel")
+    parser.add_argument("--recorded", help="JSONL file of recorded webhook bodies to replay")
+    parser.add_argument("--users", type=int, default=100, help="distinct synthetic users")
+    parser.add_argument("--group-ratio", type=float, default=0.0,
+                        help="fraction of synthetic messages sent in groups")
+    parser.add_argument("--image-ratio", type=float, default=0.0,
+                        help="fraction of synthetic messages that are images")
+    parser.add_argument("--text", default="hello", help="text of synthetic messages")
+    parser.add_argument("--answer", default="OK", help="answer returned by the fake Dify app")
+    parser.add_argument("--line-latency", type=float, default=0.05)
+    parser.add_argument("--line-jitter", type=float, default=0.0)
+    parser.add_argument("--line-failure-rate", type=float, default=0.0)
+    parser.add_argument("--dify-latency", type=float, default=1.0)
+    parser.add_argument("--dify-jitter", type=float, default=0.0)
+    parser.add_argument("--dify-failure-rate", type=float, default=0.0)
+    parser.add_argument("--upload-latency", type=float, default=0.1)
+    parser.add_argument("--upload-failure-rate", type=float, default=0.0)
+    parser.add_argument("--setting", action="append", default=[],
+                        help="extra endpoint setting as key=value, repeatable")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report the tracemalloc peak (slows the run)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from endpoints.channel_scheduler import ChannelOverloaded, ChannelScheduler, channel_key
+
+
+def run_requests(scheduler, requests, duration=0.02):
+    """Run (key, limits) requests concurrently and return the order slots were granted in"""
+    order = []
+    lock = threading.Lock()
+
+    def work(key, limits):
+        try:
+            with scheduler.slot(key, **limits):
+                with lock:
+                    order.append(key)
+                time.sleep(duration)
+        except ChannelOverloaded:
+            with lock:
+                order.append(f"{key}:dropped")
+
+    threads = []
+    for key, limits in requests:
+        thread = threading.Thread(target=work, args=(key, limits))
+        thread.start()
+        threads.append(thread)
+        # 依序進入佇列
+        time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_channel_key_hides_secret():
+    key = channel_key("secret")
+    assert key != "secret"
+    assert len(key) == 12
+    assert key == channel_key("secret")
+
+
+def test_pass_through_without_limits():
+    scheduler = ChannelScheduler()
+    started = time.monotonic()
+    order = run_requests(scheduler, [("a", {})] * 10, duration=0.05)
+    assert order == ["a"] * 10
+    # 沒有設定上限時所有請求同時執行
+    assert time.monotonic() - started < 0.4
+    stats = scheduler.stats()["a"]
+    assert stats["served"] == 10
+    assert stats["dropped"] == 0
+    assert stats["running"] == 0
+
+
+def test_busy_channel_does_not_starve_others():
+    scheduler = ChannelScheduler(max_concurrency=1)
+    order = run_requests(scheduler, [("busy", {})] * 6 + [("quiet", {})] * 2)
+    # quiet 的請求不必等 busy 全部處理完
+    assert order.index("quiet") < 4
+    assert order.count("busy") == 6
+    assert order.count("quiet") == 2
+
+
+def test_weight_gives_larger_share():
+    scheduler = ChannelScheduler(max_concurrency=1)
+    order = run_requests(scheduler, [("light", {})] * 6 + [("heavy", {"weight": "3"})] * 6)
+    first = order[1:7]
+    assert first.count("heavy") > first.count("light")
+
+
+def test_per_channel_cap():
+    scheduler = ChannelScheduler()
+    peak = {"running": 0, "max": 0}
+    lock = threading.Lock()
+
+    def work():
+        with scheduler.slot("capped", max_concurrency="2"):
+            with lock:
+                peak["running"] += 1
+                peak["max"] = max(peak["max"], peak["running"])
+            time.sleep(0.02)
+            with lock:
+                peak["running"] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak["max"] == 2
+    assert scheduler.stats()["capped"]["served"] == 6
+
+
+def test_queue_full_drops_events():
+    scheduler = ChannelScheduler()
+    order = run_requests(
+        scheduler, [("a", {"max_concurrency": 1, "max_queue": 1})] * 4, duration=0.05)
+    assert order.count("a") == 2
+    assert order.count("a:dropped") == 2
+    assert scheduler.stats()["a"]["dropped"] == 2
+
+
+def test_wait_timeout_drops_events():
+    scheduler = ChannelScheduler()
+    order = run_requests(
+        scheduler, [("a", {"max_concurrency": 1, "max_wait": 0.05})] * 3, duration=0.2)
+    assert order.count("a") == 1
+    assert order.count("a:dropped") == 2
+    stats = scheduler.stats()["a"]
+    assert stats["dropped"] == 2
+    assert stats["queued"] == 0
+    assert stats["running"] == 0
+
+
+def test_stats_filtered_by_key():
+    scheduler = ChannelScheduler()
+    run_requests(scheduler, [("a", {}), ("b", {})], duration=0)
+    assert list(scheduler.stats("b")) == ["b"]
+
+
+def test_slot_released_on_error():
+    scheduler = ChannelScheduler(max_concurrency=1)
+    with pytest.raises(RuntimeError):
+        with scheduler.slot("a"):
+            raise RuntimeError("boom")
+    assert scheduler.running == 0
+    with scheduler.slot("a"):
+        assert scheduler.running == 1
@@ -0,0 +1,86 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from endpoints import linebot
+from endpoints.linebot import GroupMessageFilter, get_group_filter
+
+BOT_USER_ID = "Ubot"
+
+
+def message(text, *mentioned):
+    mention = SimpleNamespace(mentionees=[SimpleNamespace(user_id=user_id) for user_id in mentioned])
+    return SimpleNamespace(text=text, mention=mention if mentioned else None)
+
+
+class BotUserId:
+    """Callable returning the bot user id and counting the lookups"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return BOT_USER_ID
+
+
+def test_no_trigger_admits_everything():
+    group_filter = GroupMessageFilter({})
+    assert not group_filter.enabled
+    assert group_filter.admit(message("anything"))
+
+
+def test_prefix_ignores_case():
+    group_filter = GroupMessageFilter({"group_trigger_prefixes": " !Bot , /ask "})
+    assert group_filter.admit(message("!bot hello"))
+    assert group_filter.admit(message("/ASK what"))
+    assert not group_filter.admit(message("hello !bot"))
+
+
+def test_keyword_ignores_case():
+    group_filter = GroupMessageFilter({"group_trigger_keywords": "Price,help"})
+    assert group_filter.admit(message("what is the PRICE?"))
+    assert group_filter.admit(message("Help me"))
+    assert not group_filter.admit(message("good morning"))
+
+
+def test_mention_of_bot_admitted():
+    group_filter = GroupMessageFilter({"group_trigger_mention": True})
+    bot_user_id = BotUserId()
+    assert group_filter.admit(message("@bot hi", BOT_USER_ID), bot_user_id)
+    assert not group_filter.admit(message("@alice hi", "Ualice"), bot_user_id)
+    assert bot_user_id.calls == 2
+
+
+def test_bot_user_id_not_looked_up_without_mention():
+    group_filter = GroupMessageFilter({"group_trigger_mention": True})
+    bot_user_id = BotUserId()
+    assert not group_filter.admit(message("hi"), bot_user_id)
+    assert bot_user_id.calls == 0
+
+
+def test_clear_history_command_always_admitted():
+    group_filter = GroupMessageFilter({"group_trigger_prefixes": "!bot"})
+    assert group_filter.admit(message("/clearconversationhistory"))
+
+
+@pytest.mark.parametrize("rate,admitted", [("0", False), ("1", True)])
+def test_sample_rate(rate, admitted):
+    group_filter = GroupMessageFilter({"group_trigger_prefixes": "!bot", "group_sample_rate": rate})
+    assert all(group_filter.admit(message("hello")) == admitted for _ in range(20))
+
+
+def test_filter_cached_per_channel(caplog, monkeypatch):
+    monkeypatch.setattr(linebot, "_group_filters", {})
+    settings = {"group_trigger_prefixes": "!bot", "group_sample_rate": "often"}
+    with caplog.at_level(logging.ERROR, logger="endpoints.linebot"):
+        group_filter = get_group_filter("secret", settings)
+        assert get_group_filter("secret", dict(settings)) is group_filter
+    # 無效的 sample rate 只記錄一次
+    assert caplog.text.count("Invalid group_sample_rate") == 1
+    assert group_filter.sample_rate == 0.0
+    assert get_group_filter("other", settings) is not group_filter
+    changed = get_group_filter("secret", {**settings, "group_sample_rate": "1"})
+    assert changed is not group_filter
+    assert changed.sample_rate == 1.0
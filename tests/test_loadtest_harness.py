@@ -0,0 +1,32 @@
+from loadtest import harness
+
+
+def run_harness(*argv):
+    args = harness.build_parser().parse_args([
+        "--rps", "40", "--duration", "1", "--line-latency", "0.001",
+        "--dify-latency", "0.001", "--upload-latency", "0.001", *argv])
+    return harness.run(args)
+
+
+def test_all_events_answered_without_failures():
+    report = run_harness("--image-ratio", "0.5")
+    assert report["events"]["answered"] == report["events"]["events"]
+    assert report["error_rate"] == 0.0
+
+
+def test_dify_failures_count_as_errors():
+    report = run_harness("--dify-failure-rate", "1")
+    assert report["events"]["failed"] == report["events"]["events"]
+    assert report["error_rate"] == 1.0
+
+
+def test_content_and_upload_failures_count_as_errors():
+    baseline = run_harness("--image-ratio", "1")
+    report = run_harness("--image-ratio", "1", "--line-failure-rate", "0.5",
+                         "--upload-failure-rate", "0.5")
+    events = report["events"]
+    # 取得內容失敗的事件不能算成略過，上傳失敗後的回覆不能算成已回覆
+    assert events["ignored"] == 0
+    assert events["failed"] >= events["with_injected_failure"]
+    assert events["with_injected_failure"] >= report["dify_upload_api"]["injected_failures"]
+    assert report["error_rate"] > baseline["error_rate"] + 0.5
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from endpoints.linebot import MdFlexFormatHelper, flex_payload_size
+
+BORDER = {"borderColor": "#CCCCCC", "borderWidth": "1px"}
+
+TABLE = "| Name | Note |\n|---|---|\n| **Tea** | hot |\n| Cake |"
+
+
+def cell(text, **style):
+    return {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": text, **style}],
+            "paddingAll": "sm", "width": "50.0%", **BORDER}
+
+
+# 未精簡前的表格，與原本逐一建構的 dict 相同
+BASELINE_TABLE = {
+    "type": "box", "layout": "vertical", "margin": "md", "spacing": "none",
+    "cornerRadius": "md", **BORDER,
+    "contents": [
+        {"type": "box", "layout": "horizontal", "backgroundColor": "#EEEEEE", "paddingAll": "sm",
+         **BORDER, "contents": [
+             cell("Name", weight="bold", size="xs", align="start", wrap=True),
+             cell("Note", weight="bold", size="xs", align="start", wrap=True),
+         ]},
+        {"type": "box", "layout": "horizontal", "paddingAll": "xs", "backgroundColor": "#FFFFFF",
+         **BORDER, "contents": [
+             cell("Tea", size="xs", align="start", wrap=True, weight="bold"),
+             cell("hot", size="xs", align="start", wrap=True, weight="regular"),
+         ]},
+        {"type": "box", "layout": "horizontal", "paddingAll": "xs", "backgroundColor": "#F8F8F8",
+         **BORDER, "contents": [
+             cell("Cake", size="xs", align="start", wrap=True, weight="regular"),
+             cell(" ", size="xs", align="start"),
+         ]},
+    ],
+}
+
+
+def tables(bubble):
+    return [c for c in bubble["body"]["contents"] if c.get("layout") == "vertical" and "cornerRadius" in c]
+
+
+def test_verbose_table_matches_baseline():
+    helper = MdFlexFormatHelper(compact=False)
+    assert tables(helper.md_to_flex(TABLE)) == [BASELINE_TABLE]
+    assert helper.table_size_before == helper.table_size_after == flex_payload_size([BASELINE_TABLE])
+
+
+def test_compact_table_omits_defaults_only():
+    helper = MdFlexFormatHelper()
+    [table] = tables(helper.md_to_flex(TABLE))
+    serialized = json.dumps(table)
+    assert '"align"' not in serialized
+    assert '"regular"' not in serialized
+    assert '"spacing"' not in serialized
+    # 列的內距與邊框是版面的一部分，不可省略
+    header, first, second = table["contents"]
+    assert header["paddingAll"] == "sm" and header["borderWidth"] == "1px"
+    assert first["paddingAll"] == "xs" and second["borderWidth"] == "1px"
+    assert first["contents"][0]["contents"][0]["weight"] == "bold"
+    assert [c["width"] for c in header["contents"]] == ["50%", "50%"]
+    assert helper.table_size_after == flex_payload_size([table])
+    assert helper.table_size_after < helper.table_size_before
+
+
+def test_sizes_reset_without_table():
+    helper = MdFlexFormatHelper()
+    helper.md_to_flex(TABLE)
+    helper.md_to_flex("no table here")
+    assert helper.table_size_before == helper.table_size_after == 0
+
+
+@pytest.mark.parametrize("columns", [3, 7])
+def test_widths_sum_to_at_most_100(columns):
+    header = "|" + "|".join(f"c{n}" for n in range(columns)) + "|"
+    separator = "|" + "|".join("---" for _ in range(columns)) + "|"
+    row = "|" + "|".join("x" for _ in range(columns)) + "|"
+    [table] = tables(MdFlexFormatHelper().md_to_flex(f"{header}\n{separator}\n{row}"))
+    for line in table["contents"]:
+        widths = [float(c["width"].rstrip("%")) for c in line["contents"]]
+        assert len(widths) == columns
+        assert 99 < sum(widths) <= 100
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("**bold**", "bold"),
+    ("__bold__", "bold"),
+    ("a **b** and __c__", "a b and c"),
+    ("x****y", "xy"),
+])
+def test_bold_markers_stripped(text, expected):
+    [table] = tables(MdFlexFormatHelper().md_to_flex(f"| A | B |\n|---|---|\n| {text} | plain |"))
+    text_component = table["contents"][1]["contents"][0]["contents"][0]
+    assert text_component["text"] == expected
+    assert text_component["weight"] == "bold"
+
+
+def test_short_rows_padded_and_long_rows_cut():
+    md = "| A | B | C |\n|---|---|---|\n| 1 |\n| 1 | 2 | 3 | 4 |"
+    [table] = tables(MdFlexFormatHelper().md_to_flex(md))
+    short, long = table["contents"][1:]
+    assert [c["contents"][0]["text"] for c in short["contents"]] == ["1", " ", " "]
+    assert [c["contents"][0]["text"] for c in long["contents"]] == ["1", "2", "3"]
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from endpoints.linebot import ReplyRules
+
+
+def rules(*items):
+    return ReplyRules(json.dumps(list(items)))
+
+
+def reply_text(messages):
+    return messages[0].text
+
+
+def test_keyword_ignores_case_and_whitespace():
+    reply_rules = rules({"type": "keyword", "match": "  Opening Hours ", "reply": "9-18"})
+    assert reply_text(reply_rules.match("keyword", "opening hours")) == "9-18"
+    assert reply_text(reply_rules.match("keyword", "OPENING HOURS  ")) == "9-18"
+    assert reply_rules.match("keyword", "hours") is None
+
+
+def test_keyword_requires_match():
+    reply_rules = rules({"type": "keyword", "reply": "always"}, {"type": "keyword", "match": " ", "reply": "blank"})
+    assert reply_rules.match("keyword", "anything") is None
+    assert reply_rules.match("keyword", "") is None
+
+
+@pytest.mark.parametrize("kind,key", [("sticker", "52002734"), ("postback", "action=menu")])
+def test_wildcard_fallback(kind, key):
+    reply_rules = rules({"type": kind, "match": key, "reply": "exact"}, {"type": kind, "reply": "any"})
+    assert reply_text(reply_rules.match(kind, key)) == "exact"
+    assert reply_text(reply_rules.match(kind, "other")) == "any"
+
+
+@pytest.mark.parametrize("kind", ["follow", "location"])
+def test_rules_without_match(kind):
+    reply_rules = rules({"type": kind, "reply": "hi"})
+    assert reply_text(reply_rules.match(kind)) == "hi"
+
+
+@pytest.mark.parametrize("kind", ["follow", "location"])
+def test_match_rejected_where_it_can_never_match(kind):
+    reply_rules = rules({"type": kind, "match": "x", "reply": "never"}, {"type": "sticker", "reply": "ok"})
+    assert reply_rules.match(kind) is None
+    assert reply_text(reply_rules.match("sticker", "1")) == "ok"
+
+
+def test_first_rule_wins():
+    reply_rules = rules({"type": "keyword", "match": "hi", "reply": "first"},
+                        {"type": "keyword", "match": "HI", "reply": "second"},
+                        {"type": "follow", "reply": "first"},
+                        {"type": "follow", "reply": "second"})
+    assert reply_text(reply_rules.match("keyword", "hi")) == "first"
+    assert reply_text(reply_rules.match("follow")) == "first"
+
+
+@pytest.mark.parametrize("raw", ["not json", '{"type": "follow", "reply": "hi"}'])
+def test_invalid_setting_disables_local_replies(raw):
+    reply_rules = ReplyRules(raw)
+    assert reply_rules.index == {}
+    assert reply_rules.match("follow") is None
+
+
+def test_invalid_rule_skipped():
+    reply_rules = rules({"type": "unknown", "reply": "x"},
+                        "not a rule",
+                        {"type": "sticker"},
+                        {"type": "follow", "reply": "hi"})
+    assert list(reply_rules.index) == [("follow", None)]
+
+
+def test_flex_reply():
+    bubble = {"type": "bubble", "body": {"type": "box", "layout": "vertical",
+                                         "contents": [{"type": "text", "text": "Menu"}]}}
+    reply_rules = rules({"type": "postback", "match": "menu", "reply": bubble, "alt_text": "Menu"},
+                        {"type": "postback", "match": "bad", "reply": {"type": "unknown"}})
+    [message] = reply_rules.match("postback", "menu")
+    assert message.alt_text == "Menu"
+    assert message.contents.as_json_dict() == bubble
+    assert reply_rules.match("postback", "bad") is None
+
+
+def test_quick_reply_labels_truncated_in_both_forms():
+    label = "L" * 25
+    reply_rules = rules({"type": "follow", "reply": "hi", "quick_reply": [
+        label,
+        {"type": "action", "action": {"type": "message", "label": label, "text": "full text"}},
+    ]})
+    [message] = reply_rules.match("follow")
+    text_item, button_item = [item.action for item in message.quick_reply.items]
+    assert text_item.label == button_item.label == "L" * 20
+    assert text_item.text == label
+    assert button_item.text == "full text"
+
+
+def test_quick_reply_item_limit():
+    reply_rules = rules({"type": "keyword", "match": "many", "reply": "x", "quick_reply": ["a"] * 14},
+                        {"type": "keyword", "match": "max", "reply": "x", "quick_reply": ["a"] * 13})
+    assert reply_rules.match("keyword", "many") is None
+    assert len(reply_rules.match("keyword", "max")[0].quick_reply.items) == 13
+
+
+def test_invalid_quick_reply_item_skips_rule():
+    reply_rules = rules({"type": "follow", "reply": "x", "quick_reply": [{"type": "action", "action": {"type": "bogus"}}]})
+    assert reply_rules.match("follow") is None